@@ -0,0 +1,193 @@
+import os
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from intervals import OUTAGE_COLOR, SLOT_MINUTES, SLOTS_PER_DAY, parse_span_minutes, to_iso_date
+from log_utils import get_ukraine_time, log_to_buffer
+from records import ScheduleRecord
+from state_io import atomic_write_json
+
+SLOT_HOURS = SLOT_MINUTES / 60
+
+# Година (за Києвом), після якої раз на добу надсилається дайджест
+DAILY_DIGEST_HOUR = os.getenv("DAILY_DIGEST_HOUR")
+DIGEST_STATE_FILE = Path("data") / "digest_state.json"
+
+
+class ScheduleArray:
+    """
+    Графіки всіх черг як масиви (черга x дата x слот):
+    outage — слот з відключенням, known — слот є в даних.
+    """
+
+    def __init__(self, queues: List[str], dates: List[str], outage: np.ndarray, known: np.ndarray):
+        self.queues = queues
+        self.dates = dates
+        self.outage = outage
+        self.known = known
+
+    @classmethod
+    def from_norm(cls, norm_by_queue: Dict[str, List[ScheduleRecord]]) -> "ScheduleArray":
+        """Один прохід по записах: збираємо індекси, далі заповнюємо масиви векторно."""
+        queues = sorted(norm_by_queue, key=lambda q: tuple(int(p) for p in q.split(".") if p.isdigit()))
+        q_index = {q: i for i, q in enumerate(queues)}
+        d_index: Dict[str, int] = {}
+        qi: List[int] = []
+        di: List[int] = []
+        start: List[int] = []
+        end: List[int] = []
+        red: List[bool] = []
+        # Різних span/date мало — парсимо кожен рядок один раз
+        span_cache: Dict[str, Optional[tuple]] = {}
+        date_cache: Dict[str, int] = {}
+
+        for queue_key, records in norm_by_queue.items():
+            q = q_index[queue_key]
+            for r in records:
+                span = r.span
+                bounds = span_cache.get(span, False)
+                if bounds is False:
+                    bounds = parse_span_minutes(span)
+                    if bounds is not None:
+                        bounds = (bounds[0] // SLOT_MINUTES, -(-bounds[1] // SLOT_MINUTES))
+                    span_cache[span] = bounds
+                if bounds is None:
+                    continue
+                d = date_cache.get(r.date)
+                if d is None:
+                    d = d_index.setdefault(to_iso_date(r.date), len(d_index))
+                    date_cache[r.date] = d
+                qi.append(q)
+                di.append(d)
+                start.append(bounds[0])
+                end.append(bounds[1])
+                red.append(r.color == OUTAGE_COLOR)
+
+        dates_unsorted = list(d_index)
+        order = np.argsort(dates_unsorted) if dates_unsorted else np.array([], dtype=int)
+        remap = np.empty(len(order), dtype=np.intp)
+        remap[order] = np.arange(len(order))
+
+        shape = (len(queues), len(dates_unsorted), SLOTS_PER_DAY)
+        outage = np.zeros(shape, dtype=bool)
+        known = np.zeros(shape, dtype=bool)
+        if qi:
+            qi_a = np.asarray(qi)
+            di_a = remap[np.asarray(di)]
+            start_a = np.clip(np.asarray(start), 0, SLOTS_PER_DAY)
+            end_a = np.clip(np.asarray(end), 0, SLOTS_PER_DAY)
+            red_a = np.asarray(red)
+
+            # Інтервал може займати кілька слотів: розгортаємо через маску
+            slots = np.arange(SLOTS_PER_DAY)
+            covers = (slots >= start_a[:, None]) & (slots < end_a[:, None])
+            rec_idx, slot_idx = np.nonzero(covers)
+            known[qi_a[rec_idx], di_a[rec_idx], slot_idx] = True
+            outage[qi_a[rec_idx], di_a[rec_idx], slot_idx] = red_a[rec_idx]
+
+        return cls(queues, [dates_unsorted[i] for i in order], outage, known)
+
+    def outage_hours(self) -> np.ndarray:
+        """(черга x дата) — годин відключень."""
+        return self.outage.sum(axis=2) * SLOT_HOURS
+
+    def overlap_hours(self) -> np.ndarray:
+        """(черга x черга) — годин, коли обидві черги без світла одночасно."""
+        flat = self.outage.reshape(len(self.queues), -1).astype(np.float32)
+        return flat @ flat.T * SLOT_HOURS
+
+    def longest_outage_hours(self) -> np.ndarray:
+        """(черга x дата) — найдовше безперервне відключення в межах дати."""
+        q, d, s = self.outage.shape
+        rows = self.outage.reshape(-1, s).astype(np.int8)
+        edges = np.diff(np.pad(rows, ((0, 0), (1, 1))), axis=1)
+        starts = np.argwhere(edges == 1)
+        ends = np.argwhere(edges == -1)
+        longest = np.zeros(q * d, dtype=np.int32)
+        if len(starts):
+            np.maximum.at(longest, starts[:, 0], ends[:, 1] - starts[:, 1])
+        return longest.reshape(q, d) * SLOT_HOURS
+
+    def day_over_day_delta(self) -> np.ndarray:
+        """(черга x (дата-1)) — зміна годин відключень відносно попередньої дати."""
+        return np.diff(self.outage_hours(), axis=1)
+
+    def simultaneous_queues(self) -> np.ndarray:
+        """(дата x слот) — скільки черг без світла одночасно."""
+        return self.outage.sum(axis=0)
+
+
+def _fmt_hours(hours: float) -> str:
+    whole = int(hours)
+    minutes = int(round((hours - whole) * 60))
+    return f"{whole}:{minutes:02d}"
+
+
+def build_daily_digest(norm_by_queue: Dict[str, List[ScheduleRecord]], date: str) -> str:
+    """Дайджест на дату (ISO): години, найдовше відключення, зміна до попереднього дня."""
+    arr = ScheduleArray.from_norm(norm_by_queue)
+    if date not in arr.dates:
+        return ""
+    d = arr.dates.index(date)
+
+    hours = arr.outage_hours()[:, d]
+    longest = arr.longest_outage_hours()[:, d]
+    prev = arr.outage_hours()[:, d - 1] if d > 0 else None
+    peak = arr.simultaneous_queues()[d]
+
+    parts = [f"📊 Дайджест на {datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m.%Y')}", ""]
+    for i, queue_key in enumerate(arr.queues):
+        if not arr.known[i, d].any():
+            continue
+        line = f"Черга {queue_key}: 🪫{_fmt_hours(hours[i])} (найдовше {_fmt_hours(longest[i])})"
+        if prev is not None and arr.known[i, d - 1].any():
+            delta = hours[i] - prev[i]
+            if delta:
+                sign = "+" if delta > 0 else "-"
+                line += f", {sign}{_fmt_hours(abs(delta))} до попереднього дня"
+        parts.append(line)
+
+    has_data = arr.known[:, d].any(axis=1)
+    parts.append("")
+    parts.append(f"Середньо: {_fmt_hours(float(hours[has_data].mean()))} на чергу")
+    parts.append(f"Найбільше одночасно без світла: {int(peak.max())} з {len(arr.queues)} черг")
+    return "\n".join(parts)
+
+
+def maybe_build_daily_digest(
+    norm_by_queue: Dict[str, List[ScheduleRecord]]
+) -> Optional[Tuple[str, str]]:
+    """
+    Повертає (дайджест, день) раз на добу після DAILY_DIGEST_HOUR (на завтра,
+    якщо графік уже є, інакше на сьогодні). Без змінної — вимкнено.
+    День позначається надісланим через mark_digest_sent після доставки.
+    """
+    if not DAILY_DIGEST_HOUR:
+        return None
+
+    now = get_ukraine_time()
+    today = now.strftime("%Y-%m-%d")
+    if now.hour < int(DAILY_DIGEST_HOUR):
+        return None
+
+    try:
+        with open(DIGEST_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        state = {}
+    if state.get("last_sent") == today:
+        return None
+
+    tomorrow = (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    message = build_daily_digest(norm_by_queue, tomorrow) or build_daily_digest(norm_by_queue, today)
+    if not message:
+        log_to_buffer("ℹ️ Немає даних для дайджесту")
+        return None
+
+    return message, today
+
+
+def mark_digest_sent(day: str) -> None:
+    atomic_write_json({"last_sent": day}, DIGEST_STATE_FILE)
@@ -0,0 +1,292 @@
+"""
+Історія графіків у SQLite.
+
+Кожен слот зберігається як версія з проміжком дії (valid_from, valid_to):
+при зміні кольору стара версія закривається, нова додається. Тому запис
+інкрементальний — пишуться лише змінені слоти, а не весь стан.
+
+CLI:
+    python history.py outages --queue 3.2 --month 2026-10
+    python history.py revisions --from 2026-10-01 --to 2026-10-31
+    python history.py latency --month 2026-10
+"""
+import argparse
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from intervals import (
+    OUTAGE_COLOR,
+    changed_minutes,
+    merge_segments,
+    outage_ranges,
+    parse_span_minutes,
+    to_iso_date,
+)
+from log_utils import get_ukraine_time, log_to_buffer
+from records import ScheduleRecord
+
+HISTORY_FILE = Path("data") / "history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    observed_at TEXT NOT NULL,
+    source_updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_runs_observed_at ON runs (observed_at);
+CREATE TABLE IF NOT EXISTS slots (
+    queue_key TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start_min INTEGER NOT NULL,
+    end_min INTEGER NOT NULL,
+    color TEXT NOT NULL,
+    valid_from TEXT NOT NULL,
+    valid_to TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_slots_open
+    ON slots (queue_key, date, start_min) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS ix_slots_open_date
+    ON slots (date, queue_key) WHERE valid_to IS NULL;
+CREATE TABLE IF NOT EXISTS revisions (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    queue_key TEXT NOT NULL,
+    date TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    is_first INTEGER NOT NULL,
+    added_min INTEGER NOT NULL,
+    removed_min INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_revisions_queue_date ON revisions (queue_key, date);
+CREATE INDEX IF NOT EXISTS ix_revisions_date ON revisions (date);
+"""
+
+_UPDATE_RE = re.compile(r"(\d{2}:\d{2})\s+(\d{2}\.\d{2}\.\d{4})")
+
+
+def connect(path: Path = HISTORY_FILE) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_source_time(update_str: Optional[str]) -> Optional[str]:
+    """'Дата оновлення ... 14:05 31.12.2025' -> '2025-12-31 14:05:00'."""
+    if not update_str:
+        return None
+    match = _UPDATE_RE.search(update_str)
+    if not match:
+        return None
+    return f"{to_iso_date(match.group(2))} {match.group(1)}:00"
+
+
+def record_run(
+    conn: sqlite3.Connection,
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
+    source_updated_at: Optional[str] = None,
+    observed_at: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Порівнює norm_by_queue з відкритими версіями слотів і дописує лише зміни.
+    Повертає id запуску або None, якщо змін не було.
+    """
+    observed_at = observed_at or get_ukraine_time().strftime("%Y-%m-%d %H:%M:%S")
+    run_id: Optional[int] = None
+
+    with conn:
+        for queue_key, records in norm_by_queue.items():
+            current: Dict[str, Dict[Tuple[int, int], str]] = {}
+            for r in records:
+                bounds = parse_span_minutes(r.span)
+                if bounds is None:
+                    continue
+                current.setdefault(to_iso_date(r.date), {})[bounds] = r.color
+            if not current:
+                continue
+
+            stored: Dict[str, Dict[Tuple[int, int], Tuple[int, str]]] = {}
+            for rowid, date, start, end, color in conn.execute(
+                "SELECT rowid, date, start_min, end_min, color FROM slots "
+                "WHERE queue_key = ? AND valid_to IS NULL AND date >= ?",
+                (queue_key, min(current)),
+            ):
+                stored.setdefault(date, {})[(start, end)] = (rowid, color)
+
+            for date, slots in current.items():
+                old_slots = stored.get(date, {})
+                closed: List[Tuple[str, int]] = []
+                inserted: List[Tuple] = []
+
+                for (start, end), color in slots.items():
+                    old = old_slots.get((start, end))
+                    if old is not None and old[1] == color:
+                        continue
+                    if old is not None:
+                        closed.append((observed_at, old[0]))
+                    inserted.append((queue_key, date, start, end, color, observed_at))
+
+                # Слоти, яких більше немає (напр. API змінив крок з 30 на 60 хв),
+                # закриваються, щоб старі й нові інтервали не рахувались двічі
+                for bounds, (rowid, _) in old_slots.items():
+                    if bounds not in slots:
+                        closed.append((observed_at, rowid))
+
+                if not inserted and not closed:
+                    continue
+                conn.executemany("UPDATE slots SET valid_to = ? WHERE rowid = ?", closed)
+                conn.executemany(
+                    "INSERT INTO slots (queue_key, date, start_min, end_min, color, valid_from) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    inserted,
+                )
+
+                # Зміну рахуємо по хвилинній шкалі, а не по межах слотів:
+                # інша довжина слотів із тими ж відключеннями — не ревізія
+                new_timeline = merge_segments((s, e, c) for (s, e), c in slots.items())
+                if old_slots:
+                    old_timeline = merge_segments((s, e, c) for (s, e), (_, c) in old_slots.items())
+                    added_min, removed_min = changed_minutes(old_timeline, new_timeline)
+                    if not added_min and not removed_min:
+                        continue
+                else:
+                    added_min = sum(e - s for s, e in outage_ranges(new_timeline))
+                    removed_min = 0
+
+                if run_id is None:
+                    run_id = conn.execute(
+                        "INSERT INTO runs (observed_at, source_updated_at) VALUES (?, ?)",
+                        (observed_at, source_updated_at),
+                    ).lastrowid
+                conn.execute(
+                    "INSERT INTO revisions "
+                    "(run_id, queue_key, date, observed_at, is_first, added_min, removed_min) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, queue_key, date, observed_at, int(not old_slots), added_min, removed_min),
+                )
+
+    return run_id
+
+
+def record_history(
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
+    update_str: Optional[str] = None,
+) -> None:
+    """Обгортка для monitor.main(): помилка історії не зупиняє запуск."""
+    try:
+        conn = connect()
+        try:
+            run_id = record_run(conn, norm_by_queue, parse_source_time(update_str))
+        finally:
+            conn.close()
+        if run_id is not None:
+            log_to_buffer(f"🗄 Історію доповнено (запуск #{run_id})")
+    except Exception as e:
+        log_to_buffer(f"⚠️ Помилка запису історії: {e}")
+
+
+def outage_hours(
+    conn: sqlite3.Connection,
+    date_from: str,
+    date_to: str,
+    queue_key: Optional[str] = None,
+) -> Dict[str, float]:
+    """Сума годин відключень за остаточним графіком кожної дати, по чергах."""
+    sql = (
+        "SELECT queue_key, SUM(end_min - start_min) FROM slots "
+        "WHERE valid_to IS NULL AND color = ? AND date BETWEEN ? AND ?"
+    )
+    params: List = [OUTAGE_COLOR, date_from, date_to]
+    if queue_key:
+        sql += " AND queue_key = ?"
+        params.append(queue_key)
+    sql += " GROUP BY queue_key"
+    return {q: minutes / 60 for q, minutes in conn.execute(sql, params)}
+
+
+def revision_counts(
+    conn: sqlite3.Connection,
+    date_from: str,
+    date_to: str,
+    queue_key: Optional[str] = None,
+) -> List[Tuple[str, str, int]]:
+    """Скільки разів графік дати переглядали після першої публікації."""
+    sql = (
+        "SELECT queue_key, date, SUM(1 - is_first) FROM revisions "
+        "WHERE date BETWEEN ? AND ?"
+    )
+    params: List = [date_from, date_to]
+    if queue_key:
+        sql += " AND queue_key = ?"
+        params.append(queue_key)
+    sql += " GROUP BY queue_key, date ORDER BY date, queue_key"
+    return list(conn.execute(sql, params))
+
+
+def change_latency(
+    conn: sqlite3.Connection,
+    date_from: str,
+    date_to: str,
+) -> Dict[str, Optional[float]]:
+    """
+    Затримка виявлення: observed_at мінус час "Дата оновлення" на сайті,
+    у хвилинах, по запусках зі змінами за вказані дні спостереження.
+    """
+    row = conn.execute(
+        "SELECT COUNT(*), "
+        "AVG((julianday(observed_at) - julianday(source_updated_at)) * 1440), "
+        "MAX((julianday(observed_at) - julianday(source_updated_at)) * 1440) "
+        "FROM runs WHERE source_updated_at IS NOT NULL "
+        "AND observed_at >= ? AND observed_at < ?",
+        (date_from, f"{date_to} 24"),
+    ).fetchone()
+    return {"runs": row[0], "avg_min": row[1], "max_min": row[2]}
+
+
+def _month_range(month: str) -> Tuple[str, str]:
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Запити до історії графіків")
+    parser.add_argument("command", choices=["outages", "revisions", "latency"])
+    parser.add_argument("--queue", help="черга, напр. 3.2")
+    parser.add_argument("--month", help="місяць YYYY-MM")
+    parser.add_argument("--from", dest="date_from", help="дата YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="дата YYYY-MM-DD")
+    parser.add_argument("--db", type=Path, default=HISTORY_FILE)
+    args = parser.parse_args(argv)
+
+    if args.month:
+        date_from, date_to = _month_range(args.month)
+    else:
+        date_from = args.date_from or "0000-01-01"
+        date_to = args.date_to or "9999-12-31"
+
+    conn = connect(args.db)
+    try:
+        if args.command == "outages":
+            for q, hours in sorted(outage_hours(conn, date_from, date_to, args.queue).items()):
+                print(f"{q}\t{hours:.1f} год")
+        elif args.command == "revisions":
+            for q, date, count in revision_counts(conn, date_from, date_to, args.queue):
+                print(f"{date}\t{q}\t{count}")
+        else:
+            stats = change_latency(conn, date_from, date_to)
+            if not stats["runs"]:
+                print("Немає запусків із часом оновлення")
+            else:
+                print(
+                    f"запусків: {stats['runs']}, "
+                    f"середня: {stats['avg_min']:.1f} хв, "
+                    f"макс: {stats['max_min']:.1f} хв"
+                )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from log_utils import log_to_buffer
+from state_io import atomic_write_json
+
+# Повтори з експоненційною затримкою
+RETRY_ATTEMPTS = max(1, int(os.getenv("RETRY_ATTEMPTS", "3")))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "5"))
+
+# Дубльований (hedged) запит після перцентиля затримки
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.3"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2"))
+LATENCY_WINDOW = 50
+
+# Circuit breaker по черзі
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = int(os.getenv("BREAKER_COOLDOWN", "900"))
+
+REQUEST_TIMEOUT = 10
+# Загальний ліміт (с) на завантаження всіх черг за запуск
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "90"))
+# 4xx, які все ж варто повторити
+RETRYABLE_CLIENT_ERRORS = {408, 429}
+# Верхня межа розміру відповіді, щоб збій API не з'їв пам'ять
+MAX_RESPONSE_BYTES = int(os.getenv("MAX_RESPONSE_BYTES", str(4 * 1024 * 1024)))
+# Скільки байт тіла додавати до помилки для логу
+FRAGMENT_BYTES = 200
+BREAKER_FILE = Path("data") / "breaker.json"
+
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+class CircuitOpenError(Exception):
+    """Запит не виконувався, бо breaker черги відкритий."""
+
+
+class ResponseTooLargeError(Exception):
+    """Відповідь перевищила MAX_RESPONSE_BYTES."""
+
+
+class DeadlineExceededError(Exception):
+    """Час на завантаження за цей запуск вичерпано, запит не виконувався."""
+
+
+def shutdown() -> None:
+    """Кінець запуску: не чекаємо завислих дубльованих запитів."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+    SESSION.close()
+
+
+def read_body_limited(resp: requests.Response, limit: int = MAX_RESPONSE_BYTES) -> bytes:
+    """Читає тіло потоково і обриває, щойно воно перевищує limit."""
+    declared = resp.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        resp.close()
+        raise ResponseTooLargeError(f"Content-Length {declared} > {limit}")
+
+    buf = bytearray()
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        buf += chunk
+        if len(buf) > limit:
+            resp.close()
+            error = ResponseTooLargeError(f"тіло відповіді > {limit} байт")
+            error.body_fragment = bytes(buf[:FRAGMENT_BYTES])
+            raise error
+    return bytes(buf)
+
+
+def load_breaker_state() -> Dict:
+    """Стан breaker-ів і вікно затримок з попередніх запусків."""
+    try:
+        with open(BREAKER_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
+    data.setdefault("queues", {})
+    data.setdefault("latencies", [])
+    return data
+
+
+def save_breaker_state(state: Dict) -> None:
+    atomic_write_json(state, BREAKER_FILE)
+
+
+def breaker_allows(state: Dict, key: str) -> bool:
+    """
+    closed -> запит дозволено;
+    open -> запит пропускаємо, доки не мине BREAKER_COOLDOWN;
+    після паузи — одна пробна спроба (half-open).
+    """
+    info = state["queues"].get(key)
+    if not info or info.get("state") != "open":
+        return True
+    if time.time() - info.get("opened_at", 0) >= BREAKER_COOLDOWN:
+        info["state"] = "half_open"
+        log_to_buffer(f"🔌 Breaker {key}: half-open, пробна спроба")
+        return True
+    return False
+
+
+def breaker_record(state: Dict, key: str, ok: bool) -> None:
+    info = state["queues"].setdefault(key, {"state": "closed", "failures": 0})
+    if ok:
+        if info.get("state") != "closed":
+            log_to_buffer(f"🔌 Breaker {key}: закрито")
+        info.update(state="closed", failures=0)
+        info.pop("opened_at", None)
+        return
+
+    info["failures"] = info.get("failures", 0) + 1
+    if info.get("state") == "half_open" or info["failures"] >= BREAKER_THRESHOLD:
+        info.update(state="open", opened_at=time.time())
+        log_to_buffer(f"🔌 Breaker {key}: відкрито після {info['failures']} помилок")
+
+
+def _hedge_delay(latencies: List[float]) -> float:
+    """Поріг для дубльованого запиту — перцентиль затримок попередніх запитів."""
+    if len(latencies) < 5:
+        return HEDGE_DEFAULT_DELAY
+    ordered = sorted(latencies)
+    idx = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))
+    return max(HEDGE_MIN_DELAY, ordered[idx])
+
+
+def _timed_get(url: str, params: Dict) -> Tuple[bytes, float]:
+    started = time.monotonic()
+    resp = SESSION.get(url, params=params, timeout=REQUEST_TIMEOUT, stream=True)
+    with resp:
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError as e:
+            # Тіло помилки (HTML-заглушка, JSON з причиною) корисне в лозі
+            e.body_fragment = next(resp.iter_content(chunk_size=FRAGMENT_BYTES), b"")
+            raise
+        body = read_body_limited(resp)
+    return body, time.monotonic() - started
+
+
+def _hedged_get(url: str, params: Dict, latencies: List[float]) -> Tuple[bytes, float]:
+    """
+    Шле запит; якщо відповіді нема довше за поріг — шле дублікат
+    і повертає першу успішну відповідь.
+    """
+    primary = _executor.submit(_timed_get, url, params)
+    done, _ = wait([primary], timeout=_hedge_delay(latencies))
+    if done:
+        return primary.result()
+
+    hedge = _executor.submit(_timed_get, url, params)
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+def _is_client_error(error: BaseException) -> bool:
+    """4xx означає, що повтор дасть те саме (крім 408/429)."""
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status not in RETRYABLE_CLIENT_ERRORS
+
+
+def get_with_retries(
+    url: str, params: Dict, key: str, state: Dict, deadline: Optional[float] = None
+) -> bytes:
+    """
+    GET із повторами (jitter backoff), дубльованими запитами
+    та circuit breaker для ключа `key`. Повертає сирі байти тіла.
+    deadline — time.monotonic(), після якого нові спроби не починаються.
+    """
+    if not breaker_allows(state, key):
+        raise CircuitOpenError(f"breaker відкритий для {key}")
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceededError(f"час на завантаження вичерпано, {key} не запитано")
+
+    latencies: List[float] = state["latencies"]
+    last_error: Optional[BaseException] = None
+    for attempt in range(RETRY_ATTEMPTS):
+        if attempt:
+            cap = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+            delay = random.uniform(0, cap)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                log_to_buffer(f"⌛ {key}: час на завантаження вичерпано, повтори припинено")
+                break
+            time.sleep(delay)
+        try:
+            body, elapsed = _hedged_get(url, params, latencies)
+        except ResponseTooLargeError:
+            breaker_record(state, key, False)
+            raise
+        except Exception as e:
+            if _is_client_error(e):
+                breaker_record(state, key, False)
+                raise
+            last_error = e
+            log_to_buffer(f"↻ {key}: спроба {attempt + 1}/{RETRY_ATTEMPTS} невдала: {e}")
+            continue
+
+        latencies.append(round(elapsed, 3))
+        del latencies[:-LATENCY_WINDOW]
+        breaker_record(state, key, True)
+        return body
+
+    breaker_record(state, key, False)
+    raise last_error
@@ -0,0 +1,136 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DAY_MINUTES = 24 * 60
+OUTAGE_COLOR = "red"
+# Сітка для зображення й аналітики: 48 слотів по 30 хв
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = DAY_MINUTES // SLOT_MINUTES
+
+# (start_min, end_min, color), end не включно; 24:00 == 1440
+Segment = Tuple[int, int, str]
+
+
+def to_iso_date(date: str) -> str:
+    """31.12.2025 -> 2025-12-31 (ISO вже як є)."""
+    if len(date) == 10 and date[2] == "." and date[5] == ".":
+        return f"{date[6:]}-{date[3:5]}-{date[:2]}"
+    return date
+
+
+def parse_span_minutes(span: str) -> Optional[Tuple[int, int]]:
+    """00:00-00:30 або 0000-0030 -> (0, 30); 24:00 -> 1440."""
+    if not span or "-" not in span:
+        return None
+    try:
+        start, end = (part.strip().replace(":", "") for part in span.split("-", 1))
+        bounds = int(start[:2]) * 60 + int(start[2:4]), int(end[:2]) * 60 + int(end[2:4])
+    except ValueError:
+        return None
+    if not 0 <= bounds[0] < bounds[1] <= DAY_MINUTES:
+        return None
+    return bounds
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def build_timeline(spans: Iterable[Tuple[str, str]]) -> List[Segment]:
+    """
+    (span, color) будь-якої довжини -> відсортована хвилинна шкала дати:
+    сусідні відрізки з однаковим кольором злиті, перекриття обрізані.
+    """
+    raw: List[Segment] = []
+    for span, color in spans:
+        bounds = parse_span_minutes(span)
+        if bounds is not None:
+            raw.append((bounds[0], bounds[1], color))
+    return merge_segments(raw)
+
+
+def merge_segments(raw: Iterable[Segment]) -> List[Segment]:
+    """Відрізки в хвилинах -> шкала (як у build_timeline)."""
+    timeline: List[Segment] = []
+    for start, end, color in sorted(raw):
+        if timeline:
+            p_start, p_end, p_color = timeline[-1]
+            start = max(start, p_end)
+            if start >= end:
+                continue
+            if start == p_end and color == p_color:
+                timeline[-1] = (p_start, end, color)
+                continue
+        timeline.append((start, end, color))
+    return timeline
+
+
+def timelines_by_date(records) -> Dict[str, List[Segment]]:
+    """Записи однієї черги (ScheduleRecord) -> {date: timeline}."""
+    by_date: Dict[str, List[Tuple[str, str]]] = {}
+    for r in records:
+        by_date.setdefault(r.date, []).append((r.span, r.color))
+    return {date: build_timeline(spans) for date, spans in by_date.items()}
+
+
+def outage_ranges(timeline: List[Segment]) -> List[Tuple[int, int]]:
+    """Діапазони відключень (злиті) з шкали."""
+    result: List[Tuple[int, int]] = []
+    for start, end, color in timeline:
+        if color != OUTAGE_COLOR:
+            continue
+        if result and result[-1][1] == start:
+            result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+
+def diff_timelines(old: List[Segment], new: List[Segment]) -> List[Dict]:
+    """
+    Порівнює дві шкали однієї дати за лінійний час (злиття двох
+    відсортованих списків). Проміжки, відомі лише в одній зі шкал,
+    не вважаються зміною. Результат у форматі group_spans:
+    [{"start": "HH:MM", "end": "HH:MM", "change": "added"|"removed"}].
+    """
+    return [
+        {"start": format_minutes(s), "end": format_minutes(e), "change": c}
+        for s, e, c in _diff_segments(old, new)
+    ]
+
+
+def changed_minutes(old: List[Segment], new: List[Segment]) -> Tuple[int, int]:
+    """(хвилин відключень додано, хвилин знято) між двома шкалами."""
+    added = removed = 0
+    for start, end, change in _diff_segments(old, new):
+        if change == "added":
+            added += end - start
+        else:
+            removed += end - start
+    return added, removed
+
+
+def _diff_segments(old: List[Segment], new: List[Segment]) -> List[List]:
+    changes: List[List] = []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        o_start, o_end, o_color = old[i]
+        n_start, n_end, n_color = new[j]
+        start = max(o_start, n_start)
+        end = min(o_end, n_end)
+
+        if start < end:
+            was_out = o_color == OUTAGE_COLOR
+            is_out = n_color == OUTAGE_COLOR
+            if was_out != is_out:
+                change = "added" if is_out else "removed"
+                if changes and changes[-1][1] == start and changes[-1][2] == change:
+                    changes[-1][1] = end
+                else:
+                    changes.append([start, end, change])
+
+        if o_end <= n_end:
+            i += 1
+        if n_end <= o_end:
+            j += 1
+
+    return changes
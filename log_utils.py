@@ -93,6 +93,9 @@ def send_log_to_channel() -> None:
                     "parse_mode": "HTML",
                 }
                 requests.post(url, data=data, timeout=10)
+
+        # Повторний прохід у тому ж процесі не має дублювати вже надісланий лог
+        log_messages.clear()
                 
     except Exception as e:
         # Логуємо помилку в консоль, але не падаємо
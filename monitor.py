@@ -1,19 +1,49 @@
 import os
 import json
 import hashlib
-import shutil
+import codecs
 import re
+import time
 from datetime import datetime
+from operator import attrgetter
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-import requests
+from typing import Dict, List, Tuple
+from analytics import mark_digest_sent, maybe_build_daily_digest
+from history import record_history
+from http_client import (
+    FETCH_DEADLINE,
+    CircuitOpenError,
+    DeadlineExceededError,
+    get_with_retries,
+    load_breaker_state,
+    save_breaker_state,
+    shutdown as shutdown_http_client,
+)
+from intervals import (
+    build_timeline,
+    diff_timelines,
+    format_minutes,
+    outage_ranges,
+    timelines_by_date,
+)
 from log_utils import log_to_buffer, send_log_to_channel
+from notify import NotificationEvent, TelegramSink, build_dispatcher, schedule_outages
+from records import ScheduleRecord, norm_from_json, norm_to_json
+from run_lock import acquire_run_lease
+from schedule_image import render_schedule_image
 from site_content import get_schedule_content, take_screenshot_between_elements
-from telegram_handler import send_notification
+from state_io import atomic_copy, atomic_write_json
+
+try:
+    import orjson  # опційний швидкий JSON-декодер
+except ImportError:
+    orjson = None
 
 API_BASE_URL = os.getenv("API_BASE_URL")
 URL = os.environ.get('URL')
 SUBSCRIBE = os.environ.get('SUBSCRIBE')
+# "1" — брати скріншот сайту замість локально намальованого графіка
+USE_SITE_SCREENSHOT = os.getenv("USE_SITE_SCREENSHOT") == "1"
 
 QUEUES = [(i, j) for i in range(1, 7) for j in range(1, 2 + 1)]
 
@@ -24,24 +54,52 @@ CURRENT_FILE = DATA_DIR / "current.json"
 PREVIOUS_FILE = DATA_DIR / "previous.json"
 HASH_FILE = DATA_DIR / "last_hash.json"
 
+# Версія формату хешів у last_hash.json. Якщо не збігається —
+# стан вважається порожнім і записується заново (без "змін").
+HASH_VERSION = 2
+
+
+_JSON_WHITESPACE = b" \t\r\n"
+
 
-def fetch_schedule(cherga_id: int, pidcherga_id: int) -> Tuple[List[Dict], bool]:
+def decode_schedule_payload(body: bytes):
     """
-    Тягне графік для однієї черги.
+    Декодує JSON прямо з байтів відповіді (orjson, якщо встановлений).
+    Один об'єкт замість масиву загортається в список уже після розбору;
+    лише для "{...},{...}" робиться одна копія з дужками.
+    """
+    if body.startswith(codecs.BOM_UTF8):
+        body = body[len(codecs.BOM_UTF8):]
+    loads = orjson.loads if orjson is not None else json.loads
+
+    pos = 0
+    while pos < len(body) and body[pos] in _JSON_WHITESPACE:
+        pos += 1
+    first = body[pos:pos + 1]
+
+    if first != b"{":
+        return loads(body)
+    try:
+        data = loads(body)
+    except ValueError:
+        # Кілька об'єктів через кому без зовнішніх дужок
+        return loads(b"".join((b"[", body, b"]")))
+    return [data] if isinstance(data, dict) else data
+
+
+def fetch_schedule(
+    cherga_id: int, pidcherga_id: int, breaker_state: Dict, deadline: float
+) -> Tuple[List[Dict], bool]:
+    """
+    Тягне графік для однієї черги (з повторами і circuit breaker).
     Повертає (дані, is_error).
     """
-    resp: Optional[requests.Response] = None
+    queue_key = f"{cherga_id}.{pidcherga_id}"
+    body = b""
     try:
         params = {"cherga_id": cherga_id, "pidcherga_id": pidcherga_id}
-        resp = requests.get(API_BASE_URL, params=params, timeout=10)
-        resp.raise_for_status()
-        text = resp.text.strip()
-        if text.startswith("[") and text.endswith("]"):
-            data = json.loads(text)
-        else:
-            if text.startswith("{"):
-                text = f"[{text}]"
-            data = json.loads(text)
+        body = get_with_retries(API_BASE_URL, params, queue_key, breaker_state, deadline)
+        data = decode_schedule_payload(body)
 
         if isinstance(data, list):
             return data, False
@@ -49,11 +107,14 @@ def fetch_schedule(cherga_id: int, pidcherga_id: int) -> Tuple[List[Dict], bool]
         log_to_buffer(f"⚠️ Відповідь не список для {cherga_id}.{pidcherga_id}")
         return [], False
 
+    except (CircuitOpenError, DeadlineExceededError) as e:
+        log_to_buffer(f"⏸ Пропускаю {queue_key}: {e}")
+        return [], True
     except Exception as e:
-        body = resp.text[:200] if resp is not None else ""
+        fragment = getattr(e, "body_fragment", body[:200]).decode("utf-8", errors="replace")
         log_to_buffer(
             f"❌ Помилка {cherga_id}.{pidcherga_id}: {e}. "
-            f"Фрагмент відповіді: {body}"
+            f"Фрагмент відповіді: {fragment}"
         )
         return [], True
 
@@ -63,23 +124,26 @@ def fetch_all_schedules() -> Tuple[Dict[str, List[Dict]], Dict[str, bool]]:
     all_schedules: Dict[str, List[Dict]] = {}
     has_error: Dict[str, bool] = {}
 
+    breaker_state = load_breaker_state()
+    # Коли API лежить, повтори по всіх чергах не мають розтягнути запуск
+    deadline = time.monotonic() + FETCH_DEADLINE
+
     log_to_buffer("📡 Завантажую графіки по всіх чергах...")
     for cherga_id, pidcherga_id in QUEUES:
         queue_key = f"{cherga_id}.{pidcherga_id}"
-        schedule, is_error = fetch_schedule(cherga_id, pidcherga_id)
+        schedule, is_error = fetch_schedule(cherga_id, pidcherga_id, breaker_state, deadline)
         all_schedules[queue_key] = schedule
         has_error[queue_key] = is_error
 
         error_note = " [помилка API]" if is_error else ""
         log_to_buffer(f" ✓ {queue_key}: {len(schedule)} записів{error_note}")
 
+    save_breaker_state(breaker_state)
     return all_schedules, has_error
 
 
 def save_json(data, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    atomic_write_json(data, path)
 
 
 def load_json(path: Path):
@@ -92,39 +156,61 @@ def load_json(path: Path):
         return {}
 
 
-def calculate_hash(obj) -> str:
-    json_str = json.dumps(obj, sort_keys=True, ensure_ascii=False)
-    return hashlib.md5(json_str.encode("utf-8")).hexdigest()
+_FIELD_SEP = b"\x1f"
+_RECORD_SEP = b"\x1e"
+_span_hash_cache: Dict[str, str] = {}
 
 
-def normalize_record(rec: Dict, cherga_id: int, pidcherga_id: int) -> Dict:
+def queue_digest(records: List[ScheduleRecord]) -> str:
+    """
+    Канонічний потоковий хеш черги: поля (date, span, color) кожного
+    запису в порядку сортування подаються прямо в blake2b,
+    без проміжних словників і JSON.
+    """
+    h = hashlib.blake2b(digest_size=16, person=b"queue-v%d" % HASH_VERSION)
+    update = h.update
+    for r in records:
+        update(r.date.encode())
+        update(_FIELD_SEP)
+        update(r.span.encode())
+        update(_FIELD_SEP)
+        update(r.color.encode())
+        update(_RECORD_SEP)
+    return h.hexdigest()
+
+
+def span_digest(color: str) -> str:
+    """Хеш інтервалу залежить лише від color, тож кешуємо по значенню."""
+    digest = _span_hash_cache.get(color)
+    if digest is None:
+        digest = hashlib.blake2b(
+            color.encode(), digest_size=8, person=b"span-v%d" % HASH_VERSION
+        ).hexdigest()
+        _span_hash_cache[color] = digest
+    return digest
+
+
+def normalize_record(rec: Dict, cherga_id: int, pidcherga_id: int) -> ScheduleRecord:
     """Нормалізація одного запису."""
     date = rec.get("date", "")
     span = rec.get("span", "")
     color = rec.get("color", "").strip().lower()
 
-    return {
-        "cherga": cherga_id,
-        "pidcherga": pidcherga_id,
-        "queue_key": f"{cherga_id}.{pidcherga_id}",
-        "date": date,
-        "span": span,
-        "color": color,
-    }
+    return ScheduleRecord(cherga_id, pidcherga_id, date, span, color)
 
 
 def build_state(
     raw_schedules: Dict[str, List[Dict]],
     has_error: Dict[str, bool],
 ) -> Tuple[
-    Dict[str, List[Dict]], # norm_by_queue
+    Dict[str, List[ScheduleRecord]], # norm_by_queue
     Dict[str, str], # main_hashes
     Dict[str, Dict[str, Dict[str, str]]] # span_hashes[queue][date][span]
 ]:
     """
     Будує нормалізований стан з хешами по інтервалах.
     """
-    norm_by_queue: Dict[str, List[Dict]] = {}
+    norm_by_queue: Dict[str, List[ScheduleRecord]] = {}
     main_hashes: Dict[str, str] = {}
     span_hashes: Dict[str, Dict[str, Dict[str, str]]] = {}
 
@@ -133,43 +219,85 @@ def build_state(
             continue
 
         cherga_id, pidcherga_id = map(int, queue_key.split("."))
-        norm_list: List[Dict] = []
-
-        for rec in schedule:
-            nrec = normalize_record(rec, cherga_id, pidcherga_id)
-            norm_list.append(nrec)
-
-        norm_list.sort(key=lambda r: (r["date"], r["span"]))
+        norm_list = [normalize_record(rec, cherga_id, pidcherga_id) for rec in schedule]
+        norm_list.sort(key=attrgetter("date", "span"))
         norm_by_queue[queue_key] = norm_list
 
         # Головний хеш черги — від color кожного інтервалу
-        main_hash_data = [{"date": r["date"], "span": r["span"], "color": r["color"]} for r in norm_list]
-        main_hashes[queue_key] = calculate_hash(main_hash_data)
+        main_hashes[queue_key] = queue_digest(norm_list)
 
         # Хеші по кожному інтервалу
         sh: Dict[str, Dict[str, str]] = {}
         for rec in norm_list:
-            d = rec["date"]
-            span = rec["span"]
+            d = rec.date
+            span = rec.span
             if d not in sh:
                 sh[d] = {}
-            sh[d][span] = calculate_hash({"color": rec["color"]})
+            sh[d][span] = span_digest(rec.color)
         
         span_hashes[queue_key] = sh
 
     return norm_by_queue, main_hashes, span_hashes
 
 
-def load_last_state():
-    """Завантажує хеші з last_hash.json + дані з previous.json"""
+def carry_over_failed_queues(
+    failed_queues: List[str],
+    last_state: Dict,
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
+    main_hashes: Dict[str, str],
+    span_hashes: Dict[str, Dict[str, Dict[str, str]]],
+) -> None:
+    """
+    Для черг з помилкою API переносить останній відомий стан,
+    щоб черга не випадала з last_hash.json і зміну не пропустили
+    в наступному запуску.
+    """
+    last_main = last_state.get("main_hashes", {})
+    last_span = last_state.get("span_hashes", {})
+    last_norm = last_state.get("norm_by_queue", {})
+
+    for queue_key in failed_queues:
+        if queue_key not in last_main:
+            continue
+        main_hashes[queue_key] = last_main[queue_key]
+        span_hashes[queue_key] = last_span.get(queue_key, {})
+        norm_by_queue[queue_key] = last_norm.get(queue_key, [])
+        log_to_buffer(f"♻️ {queue_key}: помилка API, залишаю попередній стан")
+
+
+def load_hash_data() -> Dict:
+    """Читає last_hash.json; хеші іншої версії відкидаються (ребейзлайн)."""
     hash_data = load_json(HASH_FILE)
-    prev_norm = load_json(PREVIOUS_FILE)
-    
+    if hash_data and hash_data.get("hash_version") != HASH_VERSION:
+        log_to_buffer(
+            f"ℹ️ Версія хешів {hash_data.get('hash_version', 1)} != {HASH_VERSION}, "
+            f"стан буде перезаписано без сповіщень"
+        )
+        return {}
+    return hash_data
+
+
+def load_last_state():
+    """
+    Завантажує хеші з last_hash.json + дані з current.json попереднього запуску.
+    Викликати ДО збереження нового стану. Черга, чий знімок не збігається
+    з хешем (запуск впав між записом двох файлів), вважається новою.
+    """
+    hash_data = load_hash_data()
+    main_hashes = dict(hash_data.get("main_hashes", {}))
+    span_hashes = hash_data.get("span_hashes", {})
+    last_norm = norm_from_json(load_json(CURRENT_FILE))
+
+    for queue_key in list(main_hashes):
+        if queue_digest(last_norm.get(queue_key, [])) != main_hashes[queue_key]:
+            log_to_buffer(f"ℹ️ {queue_key}: current.json не відповідає хешам, стан буде перезаписано")
+            del main_hashes[queue_key]
+
     return {
         "timestamp": hash_data.get("timestamp"),
-        "main_hashes": hash_data.get("main_hashes", {}),
-        "span_hashes": hash_data.get("span_hashes", {}),
-        "norm_by_queue": prev_norm,
+        "main_hashes": main_hashes,
+        "span_hashes": span_hashes,
+        "norm_by_queue": last_norm,
     }
 
 
@@ -180,6 +308,7 @@ def save_state(
 ) -> None:
     """Зберігає тільки хеші в last_hash.json"""
     data = {
+        "hash_version": HASH_VERSION,
         "timestamp": timestamp,
         "main_hashes": main_hashes,
         "span_hashes": span_hashes,
@@ -187,50 +316,25 @@ def save_state(
     save_json(data, HASH_FILE)
 
 
-def parse_span(span: str) -> Tuple[str, str]:
-    """0000-0030 або 00:00-00:30 -> (00:00, 00:30)"""
-    if not span or "-" not in span:
-        return ("", "")
-    start, end = span.split("-")
-    # Якщо вже є двокрапка, повертаємо як є
-    if ":" in start:
-        return start, end
-    return f"{start[:2]}:{start[2:]}", f"{end[:2]}:{end[2:]}"
-
-
-def group_spans(spans_changes: List[Dict]) -> List[Dict]:
-    """Групує сусідні інтервали з однаковим типом зміни."""
-    result: List[Dict] = []
-    current: Optional[Dict] = None
-
-    for item in sorted(spans_changes, key=lambda x: x["span"]):
-        start_time, end_time = parse_span(item["span"])
-
-        if not current:
-            current = {
-                "start": start_time,
-                "end": end_time,
-                "change": item["change"],
-            }
-        else:
-            if current["change"] == item["change"] and current["end"] == start_time:
-                current["end"] = end_time
-            else:
-                result.append(current)
-                current = {
-                    "start": start_time,
-                    "end": end_time,
-                    "change": item["change"],
-                }
-
-    if current:
-        result.append(current)
-
-    return result
+def commit_state(
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
+    main_hashes: Dict[str, str],
+    span_hashes: Dict[str, Dict[str, Dict[str, str]]],
+    timestamp: str,
+) -> None:
+    """
+    Фіксує знімок і хеші одним кроком наприкінці запуску:
+    current -> previous, новий current.json, потім last_hash.json.
+    """
+    if CURRENT_FILE.exists():
+        atomic_copy(CURRENT_FILE, PREVIOUS_FILE)
+    save_json(norm_to_json(norm_by_queue), CURRENT_FILE)
+    save_state(main_hashes, span_hashes, timestamp)
+    log_to_buffer("💾 Дані збережено в data/current.json, хеші — в data/last_hash.json")
 
 
 def build_diff(
-    norm_by_queue: Dict[str, List[Dict]],
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
     main_hashes: Dict[str, str],
     span_hashes: Dict[str, Dict[str, Dict[str, str]]],
     last_state: Dict,
@@ -277,44 +381,27 @@ def build_diff(
                     diff["new_dates"].append(nd)
         
         changed_dates = {}
-        cur_items = norm_by_queue.get(queue_key, [])
-        old_items_list = last_norm.get(queue_key, [])
-
-        for d in cur_sh.keys():
-            if d in new_dates:
+        dates_to_compare = [
+            d for d in cur_sh.keys()
+            if d not in new_dates and cur_sh[d] != old_sh.get(d)
+        ]
+        if dates_to_compare:
+            # Порівнюємо хвилинні шкали, а не рядки span: так зміна
+            # кроку інтервалів (15/30/60 хв) не виглядає як зміна графіка
+            cur_tl = timelines_by_date(norm_by_queue.get(queue_key, []))
+            old_tl = timelines_by_date(last_norm.get(queue_key, []))
+
+        for d in dates_to_compare:
+            if d not in old_tl:
+                log_to_buffer(f" ⚠️ Немає попередніх даних для дати {d}")
                 continue
-            
-            # Порівнюємо хеші інтервалів для цієї дати
-            cur_spans = cur_sh.get(d, {})
-            old_spans = old_sh.get(d, {})
-            
-            changes_for_date = []
-            
-            for span, cur_span_hash in cur_spans.items():
-                old_span_hash = old_spans.get(span)
-                if old_span_hash == cur_span_hash:
-                    continue
-                
-                # Хеш інтервалу змінився
-                log_to_buffer(f" 🔄 Інтервал {span} дата {d}: хеш змінився")
-                
-                # Знаходимо старий і новий запис
-                new_rec = next((r for r in cur_items if r["date"] == d and r["span"] == span), None)
-                old_rec = next((r for r in old_items_list if r["date"] == d and r["span"] == span), None)
-                
-                if new_rec and old_rec:
-                    log_to_buffer(f" Старий: color={old_rec['color']}, Новий: color={new_rec['color']}")
-                    if new_rec["color"] != old_rec["color"]:
-                        change = "added" if new_rec["color"] == "red" else "removed"
-                        changes_for_date.append({"span": span, "change": change})
-                        log_to_buffer(f" ✅ Зміна: {change}")
-                else:
-                    log_to_buffer(f" ⚠️ Не знайдено запис: new_rec={bool(new_rec)}, old_rec={bool(old_rec)}")
 
-            if changes_for_date:
-                grouped = group_spans(changes_for_date)
+            grouped = diff_timelines(old_tl[d], cur_tl.get(d, []))
+            if grouped:
                 changed_dates[d] = grouped
-                log_to_buffer(f" ✅ Для дати {d} знайдено {len(changes_for_date)} змін")
+                for g in grouped:
+                    log_to_buffer(f" 🔄 {d} {g['start']}-{g['end']}: {g['change']}")
+                log_to_buffer(f" ✅ Для дати {d} знайдено {len(grouped)} змін")
 
         if new_dates or changed_dates:
             diff["queues"].append(queue_key)
@@ -417,7 +504,7 @@ def build_changes_notification(
 
 def build_new_schedule_notification(
     diff: Dict,
-    norm_by_queue: Dict[str, List[Dict]],
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
     url: str,
     subscribe: str,
     update_str: str
@@ -459,22 +546,15 @@ def build_new_schedule_notification(
         for queue_key in sorted(
             queues_with_new_dates, key=lambda x: tuple(map(int, x.split(".")))
         ):
-            records = norm_by_queue.get(queue_key, [])
-            outages = [
-                r for r in records
-                if r["date"] == date and r["color"] == "red"
-            ]
+            records = [r for r in norm_by_queue.get(queue_key, []) if r.date == date]
+            outages = outage_ranges(build_timeline((r.span, r.color) for r in records))
 
             if outages:
-                grouped = group_spans(
-                    [{"span": o["span"], "change": "added"} for o in outages]
-                )
-
                 # Форматуємо часи компактно
                 time_ranges = []
-                for g in grouped:
-                    start = g["start"].lstrip("0") or "0:00"
-                    end = g["end"].lstrip("0") or "0:00"
+                for start_min, end_min in outages:
+                    start = format_minutes(start_min).lstrip("0") or "0:00"
+                    end = format_minutes(end_min).lstrip("0") or "0:00"
                     if start.startswith(":"):
                         start = "0" + start
                     if end.startswith(":"):
@@ -498,39 +578,15 @@ def build_new_schedule_notification(
     return "\n".join(parts)
 
 
-def send_notification_safe(message: str, img_path=None) -> bool:
-    """Надсилає повідомлення з перевіркою лімітів Telegram"""
-    CAPTION_LIMIT = 1024  # Ліміт для caption з фото
-    TEXT_LIMIT = 4096     # Ліміт для звичайного text повідомлення
-    
-    msg_len = len(message)
-    log_to_buffer(f"📝 Довжина повідомлення: {msg_len} символів")
-    
-    # Якщо є фото і текст не влазить в caption
-    if img_path and msg_len > CAPTION_LIMIT:
-        log_to_buffer(f"⚠️ Текст {msg_len} > {CAPTION_LIMIT} (ліміт caption), надсилаю спочатку фото, потім текст")
-        # Спочатку надсилаємо фото без тексту
-        send_notification("📸", img_path)
-        # Потім надсилаємо текст окремим повідомленням
-        if msg_len > TEXT_LIMIT:
-            log_to_buffer(f"⚠️ Текст {msg_len} > {TEXT_LIMIT}, обрізаю")
-            message = message[:TEXT_LIMIT-100] + "\n\n... (текст скорочено)"
-        return send_notification(message, None)
-    
-    # Якщо немає фото, але текст завеликий для text повідомлення
-    if not img_path and msg_len > TEXT_LIMIT:
-        log_to_buffer(f"⚠️ Текст {msg_len} > {TEXT_LIMIT}, обрізаю")
-        message = message[:TEXT_LIMIT-100] + "\n\n... (текст скорочено)"
-    
-    return send_notification(message, img_path)
-
-
 def main():
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_to_buffer("=" * 60)
     log_to_buffer(f"🚀 СТАРТ [{timestamp}]")
     log_to_buffer("=" * 60)
 
+    # Доставка йде у фонових потоках і не затримує виявлення змін
+    dispatcher = build_dispatcher()
+
     try:
         # 1. Завантажити графіки з API
         current_schedules, has_error = fetch_all_schedules()
@@ -544,117 +600,131 @@ def main():
         )
         log_to_buffer(f"🔐 Витягнено хеші для {len(current_main_hashes)} черг")
 
-        # 3. Зберегти поточні нормалізовані дані
-        if CURRENT_FILE.exists():
-            shutil.copy(CURRENT_FILE, PREVIOUS_FILE)
-            log_to_buffer("📋 Попередній current.json скопійовано в previous.json")
-        
-        save_json(norm_by_queue, CURRENT_FILE)
-        log_to_buffer("💾 Нормалізовані дані збережено в data/current.json")
-
-        # 4. Завантажити попередній стан
+        # 3. Завантажити попередній стан (до запису нового)
         last_state = load_last_state()
         log_to_buffer("📋 Завантажено попередній стан")
 
-        # 5. Побудувати diff
+        failed_queues = [q for q, is_error in has_error.items() if is_error]
+        if failed_queues:
+            carry_over_failed_queues(
+                failed_queues, last_state, norm_by_queue, current_main_hashes, current_span_hashes
+            )
+
+        # 3a. Щоденний дайджест (якщо задано DAILY_DIGEST_HOUR)
+        try:
+            digest = maybe_build_daily_digest(norm_by_queue)
+            if digest:
+                digest_text, digest_day = digest
+
+                # День позначається лише після доставки в Telegram,
+                # інакше відкинута чи невдала подія загубила б дайджест
+                def digest_delivered(sink_name: str) -> None:
+                    if sink_name == TelegramSink.name:
+                        mark_digest_sent(digest_day)
+
+                dispatcher.publish(
+                    NotificationEvent("digest", digest_text, on_delivered=digest_delivered)
+                )
+                log_to_buffer("📊 Щоденний дайджест поставлено в чергу")
+        except Exception as e:
+            log_to_buffer(f"⚠️ Помилка дайджесту: {e}")
+
+        # 4. Побудувати diff
         diff = build_diff(norm_by_queue, current_main_hashes, current_span_hashes, last_state)
 
         if not diff["queues"] and not diff["new_dates"]:
             log_to_buffer("✅ Дані по всіх чергах не змінилися")
-            save_state(current_main_hashes, current_span_hashes, timestamp)
+            commit_state(norm_by_queue, current_main_hashes, current_span_hashes, timestamp)
+            record_history(norm_by_queue)
             return
 
         log_to_buffer(f"🔔 Зміни виявлено для: {', '.join(diff['queues'])}")
 
-        # 6. Отримати дату оновлення з сайту
-        _, date_content = get_schedule_content()
+        # 5. Отримати дату оновлення з сайту
+        date_source, date_content = get_schedule_content()
+        log_to_buffer(f"🕐 Дата оновлення отримана через: {date_source or 'н/д'}")
+        record_history(norm_by_queue, date_content)
 
-        # 7. Скріншот із сайту
-        screenshot_path, screenshot_hash = take_screenshot_between_elements()
-        if not screenshot_path:
-            log_to_buffer("⚠️ Не вдалося створити скріншот")
+        # 6. Зображення графіка: локальний рендер або скріншот сайту
+        if USE_SITE_SCREENSHOT:
+            image_path, image_hash = take_screenshot_between_elements()
+        else:
+            image_path, image_hash = render_schedule_image(norm_by_queue, diff)
+        if not image_path:
+            log_to_buffer("⚠️ Не вдалося створити зображення графіка")
 
-        from pathlib import Path as _Path
-        img_path = _Path(screenshot_path) if screenshot_path else None
+        img_path = Path(image_path) if image_path else None
 
-        # 8. Визначаємо типи змін
+        # 7. Визначаємо типи змін
         has_new_dates = bool(diff.get("new_dates"))
         has_changes = any(
             q_info.get("changed_dates") 
             for q_info in diff["per_queue"].values()
         )
 
-        # 9. Логіка відправки повідомлень з фото
-        
-        # Випадок 1: Є ТІЛЬКИ зміни (без нових дат)
-        # -> Надсилаємо повідомлення про зміни + фото
-        if has_changes and not has_new_dates:
-            log_to_buffer("📤 Надсилаю повідомлення про зміни + фото")
+        # 8. Публікуємо події; фото йде з першим повідомленням:
+        #    зміни + фото, новий графік + фото лише якщо змін немає
+        dispatcher.publish(
+            NotificationEvent("schedule", data={"outages": schedule_outages(norm_by_queue)})
+        )
+
+        if has_changes:
             changes_msg = build_changes_notification(
                 diff, URL, SUBSCRIBE, date_content or ""
             )
             if changes_msg:
-                ok = send_notification_safe(changes_msg, img_path)
-                if ok:
-                    log_to_buffer("✅ Повідомлення про зміни відправлено")
-                else:
-                    log_to_buffer("❌ Помилка надсилання повідомлення про зміни")
+                dispatcher.publish(
+                    NotificationEvent("changes", changes_msg, img_path, {"diff": diff})
+                )
+                log_to_buffer("📤 Повідомлення про зміни + фото поставлено в чергу")
             else:
                 log_to_buffer("⚠️ Немає черг зі змінами для відправки")
-        
-        # Випадок 2: Є ТІЛЬКИ новий графік (без змін)
-        # -> Надсилаємо повідомлення про новий графік + фото
-        elif has_new_dates and not has_changes:
-            log_to_buffer("📤 Надсилаю повідомлення про новий графік + фото")
+
+        if has_new_dates:
             new_msg = build_new_schedule_notification(
                 diff, norm_by_queue, URL, SUBSCRIBE, date_content or ""
             )
             if new_msg:
-                ok = send_notification_safe(new_msg, img_path)
-                if ok:
-                    log_to_buffer("✅ Повідомлення про новий графік відправлено")
-                else:
-                    log_to_buffer("❌ Помилка надсилання повідомлення про новий графік")
+                new_img = None if has_changes else img_path
+                dispatcher.publish(
+                    NotificationEvent("new_schedule", new_msg, new_img, {"diff": diff})
+                )
+                photo_note = "без фото" if has_changes else "+ фото"
+                log_to_buffer(f"📤 Повідомлення про новий графік ({photo_note}) поставлено в чергу")
             else:
                 log_to_buffer("⚠️ Немає черг з новими датами для відправки")
-        
-        # Випадок 3: Є І зміни, І новий графік
-        # -> Надсилаємо два повідомлення: 
-        #    1) зміни + фото
-        #    2) новий графік без фото
-        elif has_changes and has_new_dates:
-            log_to_buffer("📤 Надсилаю повідомлення про зміни + фото")
-            changes_msg = build_changes_notification(
-                diff, URL, SUBSCRIBE, date_content or ""
-            )
-            if changes_msg:
-                ok1 = send_notification_safe(changes_msg, img_path)
-                if ok1:
-                    log_to_buffer("✅ Повідомлення про зміни відправлено")
-                else:
-                    log_to_buffer("❌ Помилка надсилання повідомлення про зміни")
-            
-            log_to_buffer("📤 Надсилаю повідомлення про новий графік (без фото)")
-            new_msg = build_new_schedule_notification(
-                diff, norm_by_queue, URL, SUBSCRIBE, date_content or ""
-            )
-            if new_msg:
-                ok2 = send_notification_safe(new_msg, None)  # БЕЗ фото
-                if ok2:
-                    log_to_buffer("✅ Повідомлення про новий графік відправлено")
-                else:
-                    log_to_buffer("❌ Помилка надсилання повідомлення про новий графік")
 
-        # 10. Оновити тільки хеші
-        save_state(current_main_hashes, current_span_hashes, timestamp)
-        log_to_buffer("💾 Хеші оновлено в data/last_hash.json")
+        # 9. Зафіксувати знімок і хеші
+        commit_state(norm_by_queue, current_main_hashes, current_span_hashes, timestamp)
 
     except Exception as e:
         log_to_buffer(f"❌ Критична помилка: {e}")
     finally:
+        dispatcher.close()
         send_log_to_channel()
         log_to_buffer("🏁 Завершення роботи скрипта")
 
 
+def run() -> None:
+    """
+    Точка входу з single-flight: якщо інший запуск ще працює, цей лише
+    просить його зробити ще один прохід і одразу виходить.
+    """
+    lease = acquire_run_lease()
+    if lease is None:
+        log_to_buffer("⏭ Інший запуск ще працює, прохід об'єднано з ним")
+        return
+
+    try:
+        main()
+        # Якщо оренду перехопили, повторний прохід зробить новий власник
+        if lease.renew() and lease.take_rerun_request():
+            log_to_buffer("🔁 Під час роботи були інші запуски — ще один прохід")
+            main()
+    finally:
+        shutdown_http_client()
+        lease.release()
+
+
 if __name__ == "__main__":
-    main()
+    run()
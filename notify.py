@@ -0,0 +1,368 @@
+import os
+import abc
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from http_client import SESSION
+from intervals import build_timeline, outage_ranges
+from log_utils import UKRAINE_TZ, get_ukraine_time, log_to_buffer
+from records import ScheduleRecord
+from state_io import atomic_write_text
+from telegram_handler import send_notification
+
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL")
+NOTIFY_FILE = os.getenv("NOTIFY_FILE")
+NOTIFY_ICS_FILE = os.getenv("NOTIFY_ICS_FILE")
+# Верхня межа (с) очікування доставки наприкінці запуску; без змінної
+# чекаємо стільки, скільки потрібно всім подіям у чергах з таймаутами синків
+NOTIFY_DRAIN_TIMEOUT = os.getenv("NOTIFY_DRAIN_TIMEOUT")
+
+_STOP = object()
+# Крок (с), з яким воркер перевіряє дедлайн, поки чекає на завислу доставку
+_STUCK_POLL = 0.5
+# Мінімум очікування в close(), щоб воркер устиг забрати _STOP
+_MIN_DRAIN = 1.0
+
+
+class NotificationEvent:
+    """
+    Подія для доставки. kind: "changes" | "new_schedule" | "digest" | "schedule".
+    message — готовий HTML для Telegram, data — структуровані дані (diff, діапазони).
+    on_delivered(назва синку) викликається після успішної доставки.
+    """
+    __slots__ = ("kind", "message", "image_path", "data", "created_at", "on_delivered")
+
+    def __init__(
+        self,
+        kind: str,
+        message: str = "",
+        image_path: Optional[Path] = None,
+        data: Optional[Dict] = None,
+        on_delivered: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.kind = kind
+        self.message = message
+        self.image_path = image_path
+        self.data = data or {}
+        self.on_delivered = on_delivered
+        self.created_at = get_ukraine_time().isoformat(timespec="seconds")
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "created_at": self.created_at,
+            "message": self.message,
+            "image": str(self.image_path) if self.image_path else None,
+            "data": self.data,
+        }
+
+
+def send_notification_safe(message: str, img_path=None) -> bool:
+    """Надсилає повідомлення з перевіркою лімітів Telegram"""
+    CAPTION_LIMIT = 1024  # Ліміт для caption з фото
+    TEXT_LIMIT = 4096     # Ліміт для звичайного text повідомлення
+
+    msg_len = len(message)
+    log_to_buffer(f"📝 Довжина повідомлення: {msg_len} символів")
+
+    # Якщо є фото і текст не влазить в caption
+    if img_path and msg_len > CAPTION_LIMIT:
+        log_to_buffer(f"⚠️ Текст {msg_len} > {CAPTION_LIMIT} (ліміт caption), надсилаю спочатку фото, потім текст")
+        # Спочатку надсилаємо фото без тексту
+        send_notification("📸", img_path)
+        # Потім надсилаємо текст окремим повідомленням
+        if msg_len > TEXT_LIMIT:
+            log_to_buffer(f"⚠️ Текст {msg_len} > {TEXT_LIMIT}, обрізаю")
+            message = message[:TEXT_LIMIT-100] + "\n\n... (текст скорочено)"
+        return send_notification(message, None)
+
+    # Якщо немає фото, але текст завеликий для text повідомлення
+    if not img_path and msg_len > TEXT_LIMIT:
+        log_to_buffer(f"⚠️ Текст {msg_len} > {TEXT_LIMIT}, обрізаю")
+        message = message[:TEXT_LIMIT-100] + "\n\n... (текст скорочено)"
+
+    return send_notification(message, img_path)
+
+
+class Sink(abc.ABC):
+    """Канал доставки. Кожен має власну чергу, потік, таймаут і метрики."""
+    name = "sink"
+    kinds = {"changes", "new_schedule", "digest"}
+
+    def __init__(self, max_queue: int = 32, timeout: float = 30.0) -> None:
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.timeout = timeout
+        self.metrics = {
+            "published": 0, "delivered": 0, "failed": 0,
+            "dropped": 0, "timeouts": 0, "undelivered": 0, "max_latency": 0.0,
+        }
+        self.thread: Optional[threading.Thread] = None
+        # Подія, яку воркер зараз обробляє, і доставка, що не вклалась
+        # у таймаут і ще триває
+        self.current: Optional[NotificationEvent] = None
+        self.stuck_call: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.abandoned = threading.Event()
+
+    @abc.abstractmethod
+    def deliver(self, event: NotificationEvent) -> bool:
+        """Надсилає подію; True — доставлено."""
+
+
+class TelegramSink(Sink):
+    name = "telegram"
+
+    def deliver(self, event: NotificationEvent) -> bool:
+        return send_notification_safe(event.message, event.image_path)
+
+
+class WebhookSink(Sink):
+    """POST події як JSON."""
+    name = "webhook"
+    kinds = {"changes", "new_schedule", "digest", "schedule"}
+
+    def __init__(self, url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.url = url
+
+    def deliver(self, event: NotificationEvent) -> bool:
+        resp = SESSION.post(self.url, json=event.to_dict(), timeout=self.timeout)
+        return resp.ok
+
+
+class FileSink(Sink):
+    """Дописує події в JSONL-файл (локальна черга для інших процесів)."""
+    name = "file"
+    kinds = {"changes", "new_schedule", "digest", "schedule"}
+
+    def __init__(self, path: Path, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+
+    def deliver(self, event: NotificationEvent) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+        return True
+
+
+class IcsSink(Sink):
+    """Перезаписує .ics-календар відключень з події "schedule"."""
+    name = "ics"
+    kinds = {"schedule"}
+
+    def __init__(self, path: Path, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+
+    def deliver(self, event: NotificationEvent) -> bool:
+        atomic_write_text(build_ics(event.data.get("outages", {}), event.created_at), self.path)
+        return True
+
+
+def schedule_outages(norm_by_queue: Dict[str, List[ScheduleRecord]]) -> Dict[str, List[Dict]]:
+    """{черга: [{date, start_min, end_min}]} для події "schedule"."""
+    result: Dict[str, List[Dict]] = {}
+    for queue_key, records in norm_by_queue.items():
+        by_date: Dict[str, List] = {}
+        for r in records:
+            by_date.setdefault(r.date, []).append((r.span, r.color))
+        result[queue_key] = [
+            {"date": date, "start_min": start, "end_min": end}
+            for date, spans in sorted(by_date.items())
+            for start, end in outage_ranges(build_timeline(spans))
+        ]
+    return result
+
+
+def _ics_time(date: str, minutes: int) -> str:
+    """
+    Київський час -> UTC ("...Z"): так не потрібен блок VTIMEZONE,
+    без якого суворі клієнти відкидають TZID або зсувають час.
+    """
+    day = datetime.strptime(date, "%d.%m.%Y") if "." in date else datetime.strptime(date, "%Y-%m-%d")
+    local = UKRAINE_TZ.localize(day + timedelta(minutes=minutes))
+    return local.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def build_ics(outages: Dict[str, List[Dict]], stamp: str) -> str:
+    dtstamp = datetime.fromisoformat(stamp).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//sitemonitor//outages//UK",
+        "CALSCALE:GREGORIAN",
+        "X-WR-TIMEZONE:Europe/Kyiv",
+    ]
+    for queue_key, ranges in sorted(outages.items()):
+        for r in ranges:
+            start = _ics_time(r["date"], r["start_min"])
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{queue_key}-{start}@sitemonitor",
+                f"DTSTAMP:{dtstamp}",
+                f"DTSTART:{start}",
+                f"DTEND:{_ics_time(r['date'], r['end_min'])}",
+                f"SUMMARY:Черга {queue_key}: відключення",
+                "END:VEVENT",
+            ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+class NotificationDispatcher:
+    """
+    Неблокуюча доставка: publish() лише кладе подію в черги синків,
+    надсилання йде у фонових потоках. close() дочікується черг з таймаутом.
+    """
+
+    def __init__(self, sinks: List[Sink]) -> None:
+        self.sinks = sinks
+        # time.monotonic() кінця очікування; задається в close()
+        self.deadline: Optional[float] = None
+        for sink in sinks:
+            sink.thread = threading.Thread(
+                target=self._worker, args=(sink,), name=f"notify-{sink.name}", daemon=True
+            )
+            sink.thread.start()
+
+    def publish(self, event: NotificationEvent) -> None:
+        for sink in self.sinks:
+            if event.kind not in sink.kinds:
+                continue
+            sink.metrics["published"] += 1
+            try:
+                sink.queue.put_nowait(event)
+            except queue.Full:
+                sink.metrics["dropped"] += 1
+                log_to_buffer(f"⚠️ [{sink.name}] черга переповнена, подію {event.kind} відкинуто")
+
+    def _worker(self, sink: Sink) -> None:
+        while not sink.abandoned.is_set():
+            event = sink.queue.get()
+            if event is _STOP:
+                return
+            sink.current = event
+            self._deliver_one(sink, event)
+            self._take_current(sink)
+
+    @staticmethod
+    def _take_current(sink: Sink) -> Optional[NotificationEvent]:
+        with sink.lock:
+            event, sink.current = sink.current, None
+        return event
+
+    def _deliver_one(self, sink: Sink, event: NotificationEvent) -> None:
+        # Поки попередня подія ще надсилається, наступну не шлемо,
+        # інакше вона може дійти раніше за попередню. Чекаємо до дедлайну
+        # close(); лише після нього подію вважаємо недоставленою.
+        while sink.stuck_call is not None and sink.stuck_call.is_alive():
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                if self._take_current(sink) is not None:
+                    sink.metrics["undelivered"] += 1
+                    log_to_buffer(f"⚠️ [{sink.name}] канал завис, {event.kind} від {event.created_at} не надіслано")
+                return
+            sink.stuck_call.join(_STUCK_POLL)
+        sink.stuck_call = None
+
+        result: Dict[str, object] = {}
+
+        def target() -> None:
+            try:
+                result["ok"] = sink.deliver(event)
+            except Exception as e:
+                result["error"] = e
+
+        started = time.monotonic()
+        # Окремий потік, щоб завислий канал не тримав чергу довше за таймаут
+        call = threading.Thread(target=target, daemon=True)
+        call.start()
+        call.join(sink.timeout)
+        latency = time.monotonic() - started
+        sink.metrics["max_latency"] = max(sink.metrics["max_latency"], round(latency, 3))
+
+        if call.is_alive():
+            sink.stuck_call = call
+            sink.metrics["timeouts"] += 1
+            log_to_buffer(f"⏱ [{sink.name}] {event.kind}: таймаут {sink.timeout} с")
+        elif result.get("ok"):
+            sink.metrics["delivered"] += 1
+            log_to_buffer(f"✅ [{sink.name}] {event.kind} доставлено за {latency:.1f} с")
+            if event.on_delivered is not None:
+                try:
+                    event.on_delivered(sink.name)
+                except Exception as e:
+                    log_to_buffer(f"⚠️ [{sink.name}] {event.kind}: помилка після доставки: {e}")
+        else:
+            sink.metrics["failed"] += 1
+            log_to_buffer(f"❌ [{sink.name}] {event.kind} не доставлено: {result.get('error', 'помилка')}")
+
+    def drain_budget(self) -> float:
+        """
+        Скільки чекати, щоб кожен синк устиг віддати чергу, подію в роботі
+        і дочекатися завислої доставки.
+        """
+        budget = max(
+            (
+                (
+                    sink.queue.qsize()
+                    + (sink.current is not None)
+                    + (sink.stuck_call is not None and sink.stuck_call.is_alive())
+                ) * sink.timeout
+                for sink in self.sinks
+            ),
+            default=0.0,
+        )
+        budget = max(budget, _MIN_DRAIN)
+        if NOTIFY_DRAIN_TIMEOUT:
+            budget = min(budget, float(NOTIFY_DRAIN_TIMEOUT))
+        return budget
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        if timeout is None:
+            timeout = self.drain_budget()
+        deadline = self.deadline = time.monotonic() + timeout
+        for sink in self.sinks:
+            try:
+                sink.queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        for sink in self.sinks:
+            sink.thread.join(max(0.0, deadline - time.monotonic()))
+            if sink.thread.is_alive():
+                sink.abandoned.set()
+                self._log_undelivered(sink)
+            log_to_buffer(f"📈 [{sink.name}] {sink.metrics}")
+
+    def _log_undelivered(self, sink: Sink) -> None:
+        """Після дедлайну записує в лог кожну подію, що лишилась у черзі."""
+        log_to_buffer(f"⚠️ [{sink.name}] не встиг доставити всі події")
+        event = self._take_current(sink)
+        if event is not None:
+            sink.metrics["undelivered"] += 1
+            log_to_buffer(f"⚠️ [{sink.name}] не підтверджено: {event.kind} від {event.created_at}")
+        while True:
+            try:
+                event = sink.queue.get_nowait()
+            except queue.Empty:
+                return
+            if event is _STOP:
+                continue
+            sink.metrics["undelivered"] += 1
+            log_to_buffer(f"⚠️ [{sink.name}] не доставлено: {event.kind} від {event.created_at}")
+
+
+def build_dispatcher() -> NotificationDispatcher:
+    """Telegram завжди; інші канали — якщо задані змінні середовища."""
+    sinks: List[Sink] = [TelegramSink(timeout=60)]
+    if NOTIFY_WEBHOOK_URL:
+        sinks.append(WebhookSink(NOTIFY_WEBHOOK_URL, timeout=10))
+    if NOTIFY_FILE:
+        sinks.append(FileSink(Path(NOTIFY_FILE), timeout=5))
+    if NOTIFY_ICS_FILE:
+        sinks.append(IcsSink(Path(NOTIFY_ICS_FILE), timeout=5))
+    return NotificationDispatcher(sinks)
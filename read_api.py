@@ -0,0 +1,236 @@
+"""
+Локальний HTTP API для ботів і віджетів: віддає останній графік
+з data/current.json (його перезаписує monitor.py) з пам'яті.
+
+    GET /schedules              — norm_by_queue повністю
+    GET /schedules/<черга>      — записи однієї черги
+    GET /outages                — діапазони відключень усіх черг
+    GET /outages/<черга>        — діапазони відключень однієї черги
+    GET /next-outage/<черга>    — поточне або найближче відключення
+
+Відповіді мають сильний ETag (304 на If-None-Match) і заздалегідь
+стиснуте gzip-тіло. Запуск: python read_api.py
+"""
+import os
+import gzip
+import json
+import hashlib
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from intervals import build_timeline, format_minutes, outage_ranges, to_iso_date
+from log_utils import UKRAINE_TZ
+
+DATA_FILE = Path("data") / "current.json"
+HOST = os.getenv("READ_API_HOST", "127.0.0.1")
+PORT = int(os.getenv("READ_API_PORT", "8080"))
+# Як часто (с) перевіряти mtime current.json
+RELOAD_INTERVAL = 1.0
+
+
+class Body:
+    """
+    Готова відповідь: JSON, gzip-версія і ETag-и рахуються один раз.
+    Сильний ETag має бути свій для кожного кодування, тож у gzip — суфікс -gz.
+    """
+    __slots__ = ("raw", "gz", "etag", "gz_etag")
+
+    def __init__(self, obj) -> None:
+        self.raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gz = gzip.compress(self.raw, compresslevel=6, mtime=0)
+        digest = hashlib.blake2b(self.raw, digest_size=16).hexdigest()
+        self.etag = '"%s"' % digest
+        self.gz_etag = '"%s-gz"' % digest
+
+
+def queue_outage_ranges(records: List[Dict]) -> List[Dict]:
+    """Злиті діапазони відключень черги: [{date, start, end}], date в ISO."""
+    by_date: Dict[str, List[Tuple[str, str]]] = {}
+    for r in records:
+        by_date.setdefault(r["date"], []).append((r["span"], r["color"]))
+
+    result: List[Dict] = []
+    for date in sorted(by_date, key=to_iso_date):
+        iso = to_iso_date(date)
+        result.extend(
+            {"date": iso, "start": format_minutes(s), "end": format_minutes(e)}
+            for s, e in outage_ranges(build_timeline(by_date[date]))
+        )
+    return result
+
+
+class ScheduleCache:
+    """Знімок current.json з готовими тілами; перебудовується при зміні файлу."""
+
+    def __init__(self, path: Path = DATA_FILE) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.bodies: Dict[str, Body] = {}
+        # черга -> (відсортовані epoch-початки, діапазони з epoch-кінцями)
+        self.timeline: Dict[str, Tuple[List[float], List[Tuple[float, float, Dict]]]] = {}
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.checked_at < RELOAD_INTERVAL:
+            return
+        with self.lock:
+            if not force and now - self.checked_at < RELOAD_INTERVAL:
+                return
+            self.checked_at = now
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                return
+            if mtime == self.mtime and not force:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    norm_by_queue = json.load(f)
+            except (OSError, ValueError):
+                # Файл саме перезаписують — спробуємо наступного разу
+                return
+            self._rebuild(norm_by_queue)
+            self.mtime = mtime
+
+    def _rebuild(self, norm_by_queue: Dict[str, List[Dict]]) -> None:
+        bodies: Dict[str, Body] = {"/schedules": Body(norm_by_queue)}
+        all_outages: Dict[str, List[Dict]] = {}
+        timeline = {}
+
+        for queue_key, records in norm_by_queue.items():
+            ranges = queue_outage_ranges(records)
+            all_outages[queue_key] = ranges
+            bodies[f"/schedules/{queue_key}"] = Body(records)
+            bodies[f"/outages/{queue_key}"] = Body(ranges)
+
+            spans = []
+            for r in ranges:
+                start = _epoch(r["date"], r["start"])
+                end = _epoch(r["date"], r["end"])
+                spans.append((start, end, r))
+            spans.sort(key=lambda item: item[0])
+            timeline[queue_key] = ([s[0] for s in spans], spans)
+
+        bodies["/outages"] = Body(all_outages)
+        self.bodies = bodies
+        self.timeline = timeline
+
+    def next_outage(self, queue_key: str, now: float) -> Optional[Dict]:
+        """Відключення, що йде зараз, або найближче наступне (бінарний пошук)."""
+        entry = self.timeline.get(queue_key)
+        if entry is None:
+            return None
+        starts, spans = entry
+        idx = bisect_right(starts, now) - 1
+        if idx >= 0 and spans[idx][1] > now:
+            return {**spans[idx][2], "active": True}
+        if idx + 1 < len(spans):
+            return {**spans[idx + 1][2], "active": False}
+        return {}
+
+
+def _epoch(date: str, hhmm: str) -> float:
+    """
+    ISO-дата + HH:MM (24:00 допускається) за Києвом -> unix time.
+    Локалізується саме момент, а не північ, бо в дні переходу на літній
+    чи зимовий час доба триває 23 або 25 годин.
+    """
+    hours, minutes = map(int, hhmm.split(":"))
+    moment = datetime.strptime(date, "%Y-%m-%d")
+    if hours == 24:
+        moment += timedelta(days=1)
+        hours = 0
+    moment = moment.replace(hour=hours, minute=minutes)
+    return UKRAINE_TZ.localize(moment).timestamp()
+
+
+CACHE = ScheduleCache()
+
+
+class ReadApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "sitemonitor-read-api"
+
+    def do_GET(self) -> None:
+        CACHE.refresh()
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+
+        if path.startswith("/next-outage/"):
+            queue_key = path[len("/next-outage/"):]
+            result = CACHE.next_outage(queue_key, time.time())
+            if result is None:
+                self._send_error(404, "unknown queue")
+                return
+            self._send_body(Body(result), cache_control="no-cache, max-age=0")
+            return
+
+        body = CACHE.bodies.get(path)
+        if body is None:
+            self._send_error(404, "not found")
+            return
+        self._send_body(body)
+
+    def _send_body(self, body: Body, cache_control: str = "no-cache") -> None:
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = body.gz_etag if use_gzip else body.etag
+        if self._etag_matches(etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        payload = body.gz if use_gzip else body.raw
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _etag_matches(self, etag: str) -> bool:
+        header = self.headers.get("If-None-Match")
+        if not header:
+            return False
+        candidates = [tag.strip() for tag in header.split(",")]
+        return "*" in candidates or etag in candidates
+
+    def _send_error(self, status: int, message: str) -> None:
+        payload = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve(host: str = HOST, port: int = PORT) -> None:
+    CACHE.refresh(force=True)
+    server = ThreadingHTTPServer((host, port), ReadApiHandler)
+    server.daemon_threads = True
+    print(f"📡 Read API на http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()
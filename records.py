@@ -0,0 +1,57 @@
+import sys
+from typing import Dict, List, Tuple
+
+_queue_keys: Dict[Tuple[int, int], str] = {}
+
+
+class ScheduleRecord:
+    """
+    Нормалізований запис графіка (один інтервал однієї черги).
+    __slots__ замість словника; date/span/color інтерновані,
+    queue_key спільний для всіх записів черги.
+    """
+    __slots__ = ("cherga", "pidcherga", "queue_key", "date", "span", "color")
+
+    def __init__(self, cherga: int, pidcherga: int, date: str, span: str, color: str) -> None:
+        key = (cherga, pidcherga)
+        queue_key = _queue_keys.get(key)
+        if queue_key is None:
+            queue_key = _queue_keys[key] = sys.intern(f"{cherga}.{pidcherga}")
+        self.cherga = cherga
+        self.pidcherga = pidcherga
+        self.queue_key = queue_key
+        self.date = sys.intern(date)
+        self.span = sys.intern(span)
+        self.color = sys.intern(color)
+
+    def __repr__(self) -> str:
+        return f"ScheduleRecord({self.queue_key} {self.date} {self.span} {self.color})"
+
+    def to_dict(self) -> Dict:
+        """Формат current.json / previous.json."""
+        return {
+            "cherga": self.cherga,
+            "pidcherga": self.pidcherga,
+            "queue_key": self.queue_key,
+            "date": self.date,
+            "span": self.span,
+            "color": self.color,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScheduleRecord":
+        return cls(
+            int(data.get("cherga", 0)),
+            int(data.get("pidcherga", 0)),
+            data.get("date", ""),
+            data.get("span", ""),
+            data.get("color", ""),
+        )
+
+
+def norm_to_json(norm_by_queue: Dict[str, List[ScheduleRecord]]) -> Dict[str, List[Dict]]:
+    return {q: [r.to_dict() for r in records] for q, records in norm_by_queue.items()}
+
+
+def norm_from_json(data: Dict[str, List[Dict]]) -> Dict[str, List[ScheduleRecord]]:
+    return {q: [ScheduleRecord.from_dict(d) for d in records] for q, records in data.items()}
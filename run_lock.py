@@ -0,0 +1,163 @@
+import os
+import json
+import fcntl
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+from log_utils import log_to_buffer
+
+LOCK_FILE = Path("data") / "run.lock"
+RERUN_FILE = Path("data") / "run.rerun"
+# Скільки секунд запуск тримає оренду; завислий довше запуск можна витіснити
+LEASE_SECONDS = int(os.getenv("RUN_LEASE_SECONDS", "600"))
+# Як часто живий запуск продовжує оренду
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+
+
+class RunLease:
+    """
+    Оренда на запуск (single-flight). Поки вона є, інші запуски не
+    виконують роботу: вони лише просять власника зробити ще один прохід.
+    Фоновий потік продовжує оренду, доки запуск працює.
+    """
+
+    def __init__(self, path: Path, token: str) -> None:
+        self.path = path
+        self.token = token
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start_heartbeat(self) -> None:
+        self._heartbeat = threading.Thread(target=self._beat, name="run-lease", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            if not self.renew():
+                return
+
+    def take_rerun_request(self) -> bool:
+        """True, якщо під час роботи приходили інші запуски (прапорець знімається)."""
+        try:
+            RERUN_FILE.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def renew(self) -> bool:
+        """Продовжує оренду, лише якщо вона досі наша. False — оренду втрачено."""
+        with _guard(self.path):
+            lease = _read_lease(self.path)
+            if lease is None or lease.get("token") != self.token:
+                if not self.lost:
+                    log_to_buffer("⚠️ Оренду запуску перехопив інший запуск")
+                self.lost = True
+                return False
+            _write_lease(self.path, self.token, os.O_WRONLY | os.O_TRUNC)
+            return True
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with _guard(self.path):
+            lease = _read_lease(self.path)
+            if lease is None or lease.get("token") != self.token:
+                return  # оренду вже витіснили — чужий файл не чіпаємо
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def _guard(path: Path):
+    """
+    Короткий flock навколо читання й запису оренди, щоб два запуски
+    не витіснили чи не продовжили одну й ту саму оренду одночасно.
+    """
+    guard = path.with_name(path.name + ".guard")
+    with open(guard, "a") as g:
+        fcntl.flock(g, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(g, fcntl.LOCK_UN)
+
+
+def _read_lease(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_lease(path: Path, token: str, flags: int) -> None:
+    now = time.time()
+    fd = os.open(path, flags, 0o644)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({
+            "token": token,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "acquired_at": now,
+            "expires_at": now + LEASE_SECONDS,
+        }, f)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _lease_expired(path: Path) -> bool:
+    if not path.exists():
+        return True
+    lease = _read_lease(path)
+    if lease is None:
+        # Пошкоджений файл — орієнтуємося на час зміни
+        try:
+            return path.stat().st_mtime + LEASE_SECONDS < time.time()
+        except FileNotFoundError:
+            return True
+    if lease.get("expires_at", 0) < time.time():
+        return True
+    # Власник на цьому ж хості вже завершився (напр. його вбили)
+    pid = lease.get("pid")
+    return (
+        lease.get("host") == socket.gethostname()
+        and isinstance(pid, int)
+        and not _pid_alive(pid)
+    )
+
+
+def acquire_run_lease(path: Path = LOCK_FILE) -> Optional[RunLease]:
+    """
+    Повертає оренду або None, якщо інший запуск уже працює.
+    У другому випадку лишає прапорець, щоб власник зробив ще один прохід.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    token = f"{socket.gethostname()}:{os.getpid()}:{time.time_ns()}"
+
+    with _guard(path):
+        if path.exists():
+            if not _lease_expired(path):
+                RERUN_FILE.touch()
+                return None
+            log_to_buffer("⚠️ Знайдено прострочену оренду запуску, перехоплюю")
+            path.unlink()
+        _write_lease(path, token, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+
+    lease = RunLease(path, token)
+    lease.start_heartbeat()
+    return lease
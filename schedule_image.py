@@ -0,0 +1,184 @@
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from intervals import SLOT_MINUTES, SLOTS_PER_DAY, timelines_by_date
+from log_utils import log_to_buffer
+from records import ScheduleRecord
+
+IMAGE_DIR = Path("images")
+RENDER_VERSION = 1
+
+CELL_W = 26
+CELL_H = 24
+LABEL_W = 60
+HEADER_H = 34
+HOURS_H = 20
+PANEL_GAP = 16
+PADDING = 12
+
+COLORS = {
+    "red": (214, 48, 49),
+    "white": (236, 240, 241),
+}
+UNKNOWN_COLOR = (178, 190, 195)
+GRID_COLOR = (99, 110, 114)
+CHANGED_COLOR = (253, 203, 110)
+BG_COLOR = (255, 255, 255)
+TEXT_COLOR = (45, 52, 54)
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _time_to_slot(hhmm: str) -> int:
+    """'HH:MM' або 'HHMM' -> номер 30-хвилинного слота."""
+    hhmm = hhmm.replace(":", "")
+    minutes = int(hhmm[:2]) * 60 + int(hhmm[2:4])
+    return minutes // SLOT_MINUTES
+
+
+def _date_key(date: str):
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(date, fmt)
+        except ValueError:
+            continue
+    return datetime.max
+
+
+def _queue_key_sort(queue_key: str):
+    return tuple(map(int, queue_key.split(".")))
+
+
+def build_grid(
+    norm_by_queue: Dict[str, List[ScheduleRecord]]
+) -> Tuple[List[str], List[str], Dict[Tuple[str, str], List[Optional[str]]]]:
+    """Повертає (дати, черги, grid[(date, queue)] -> 48 кольорів)."""
+    grid: Dict[Tuple[str, str], List[Optional[str]]] = {}
+    dates: Set[str] = set()
+
+    for queue_key, records in norm_by_queue.items():
+        for date, timeline in timelines_by_date(records).items():
+            row = grid[(date, queue_key)] = [None] * SLOTS_PER_DAY
+            dates.add(date)
+            # Відрізок будь-якої довжини зафарбовує всі слоти, які перекриває
+            for start, end, color in timeline:
+                first = start // SLOT_MINUTES
+                last = -(-end // SLOT_MINUTES)
+                row[first:last] = [color] * (last - first)
+
+    queues = sorted(norm_by_queue.keys(), key=_queue_key_sort)
+    return sorted(dates, key=_date_key), queues, grid
+
+
+def changed_slots(diff: Optional[Dict]) -> Set[Tuple[str, str, int]]:
+    """Слоти (date, queue, slot), що змінилися згідно з diff."""
+    result: Set[Tuple[str, str, int]] = set()
+    if not diff:
+        return result
+
+    for queue_key, info in diff.get("per_queue", {}).items():
+        for date, ranges in info.get("changed_dates", {}).items():
+            for r in ranges:
+                try:
+                    start = _time_to_slot(r["start"])
+                    end = _time_to_slot(r["end"])
+                except (KeyError, ValueError):
+                    continue
+                for slot in range(start, min(end, SLOTS_PER_DAY)):
+                    result.add((date, queue_key, slot))
+    return result
+
+
+def _content_hash(dates, queues, grid, changed) -> str:
+    h = hashlib.blake2b(digest_size=12, person=b"image-v%d" % RENDER_VERSION)
+    for date in dates:
+        for queue_key in queues:
+            row = grid.get((date, queue_key))
+            h.update(f"{date}|{queue_key}|".encode())
+            if row:
+                h.update(",".join(c or "" for c in row).encode())
+            h.update(b"\x1e")
+    for item in sorted(changed):
+        h.update(f"{item[0]}|{item[1]}|{item[2]}".encode())
+    return h.hexdigest()
+
+
+def _draw(dates, queues, grid, changed) -> Image.Image:
+    title_font = _load_font(18)
+    font = _load_font(12)
+
+    panel_h = HEADER_H + HOURS_H + CELL_H * len(queues)
+    width = PADDING * 2 + LABEL_W + CELL_W * SLOTS_PER_DAY
+    height = PADDING * 2 + panel_h * len(dates) + PANEL_GAP * max(0, len(dates) - 1)
+
+    image = Image.new("RGB", (width, height), BG_COLOR)
+    draw = ImageDraw.Draw(image)
+
+    y = PADDING
+    for date in dates:
+        draw.text((PADDING, y + 6), date, fill=TEXT_COLOR, font=title_font)
+        y += HEADER_H
+
+        x0 = PADDING + LABEL_W
+        for hour in range(0, 24, 2):
+            draw.text((x0 + hour * 2 * CELL_W + 2, y + 2), f"{hour:02d}", fill=TEXT_COLOR, font=font)
+        y += HOURS_H
+
+        for queue_key in queues:
+            draw.text((PADDING, y + 5), queue_key, fill=TEXT_COLOR, font=font)
+            row = grid.get((date, queue_key)) or [None] * SLOTS_PER_DAY
+            for slot, color in enumerate(row):
+                x = x0 + slot * CELL_W
+                box = (x, y, x + CELL_W - 1, y + CELL_H - 1)
+                fill = COLORS.get(color, UNKNOWN_COLOR) if color else UNKNOWN_COLOR
+                draw.rectangle(box, fill=fill, outline=GRID_COLOR)
+                if (date, queue_key, slot) in changed:
+                    draw.rectangle(
+                        (box[0] + 1, box[1] + 1, box[2] - 1, box[3] - 1),
+                        outline=CHANGED_COLOR,
+                        width=3,
+                    )
+            y += CELL_H
+
+        y += PANEL_GAP
+
+    return image
+
+
+def render_schedule_image(
+    norm_by_queue: Dict[str, List[ScheduleRecord]],
+    diff: Optional[Dict] = None,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Малює сітку черга x 48 слотів по кожній даті з norm_by_queue,
+    змінені слоти підсвічені. Результат кешується за хешем вмісту.
+    Повертає (шлях, хеш) як take_screenshot_between_elements.
+    """
+    try:
+        dates, queues, grid = build_grid(norm_by_queue)
+        if not dates or not queues:
+            log_to_buffer("⚠️ Немає даних для зображення графіка")
+            return None, None
+
+        changed = changed_slots(diff)
+        content_hash = _content_hash(dates, queues, grid, changed)
+        image_path = IMAGE_DIR / f"schedule_{content_hash}.png"
+
+        if image_path.exists():
+            log_to_buffer(f"🖼 Зображення графіка з кешу: {image_path.name}")
+            return str(image_path), content_hash
+
+        IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+        _draw(dates, queues, grid, changed).save(image_path, optimize=True)
+        log_to_buffer(f"🖼 Зображення графіка створено. Хеш: {content_hash}")
+        return str(image_path), content_hash
+    except Exception as e:
+        log_to_buffer(f"❌ Помилка створення зображення графіка: {e}")
+        return None, None
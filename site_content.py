@@ -1,17 +1,136 @@
 import os
+import re
 import hashlib
+from html.parser import HTMLParser
 from io import BytesIO
-from typing import Tuple, Optional
-import requests
-from bs4 import BeautifulSoup
+from typing import List, Tuple, Optional
 from playwright.sync_api import sync_playwright
 from PIL import Image
+from http_client import SESSION, read_body_limited
 from log_utils import log_to_buffer
 
 URL = os.getenv("URL")
 
+# Маркер може бути розбитий inline-тегами: "Дата <b>оновлення</b>"
+UPDATE_MARKER_RE = re.compile(r"Дата\s+оновлення")
+# Формат, який розбирає history.parse_source_time: "14:05 31.12.2025"
+UPDATE_TIME_RE = re.compile(r"\d{2}:\d{2}\s+\d{2}\.\d{2}\.\d{4}")
+
+class _UpdateDateFound(Exception):
+    """Зупиняє розбір, щойно дату знайдено."""
+
+class _UpdateDateParser(HTMLParser):
+    """
+    Однопрохідний пошук тексту "Дата оновлення ..." у HTML.
+    Збирає текст від маркера до кінця блоку, в якому стоїть маркер,
+    і зупиняє розбір — решта сторінки не читається.
+    """
+    SKIP_TAGS = {"script", "style", "noscript", "template"}
+    BREAK_TAGS = {"br", "div", "p", "span", "li", "td", "tr", "section",
+                  "h1", "h2", "h3", "h4", "h5", "h6"}
+    # Теги, що обмежують блок з маркером (br і span лише розривають рядок)
+    BLOCK_TAGS = BREAK_TAGS - {"br", "span"}
+    MAX_CAPTURE = 400
+    # Скільки останніх символів тексту тримати для пошуку маркера між вузлами
+    RECENT_CHARS = 64
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.skip_depth = 0
+        self.block_depth = 0
+        self.capture_depth = 0
+        self.capturing = False
+        self.parts: List[str] = []
+        self.size = 0
+        self.recent = ""
+
+    def _boundary(self) -> None:
+        if not self.capturing:
+            return
+        if UPDATE_TIME_RE.search("".join(self.parts)):
+            raise _UpdateDateFound
+        self.parts.append("\n")
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if tag in self.BLOCK_TAGS:
+            self.block_depth += 1
+        if tag in self.BREAK_TAGS:
+            self._boundary()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if tag in self.BREAK_TAGS:
+            self._boundary()
+        if tag in self.BLOCK_TAGS:
+            self.block_depth = max(0, self.block_depth - 1)
+            # Блок з маркером закрито: далі йде вже інший вміст сторінки
+            if self.capturing and self.block_depth < self.capture_depth:
+                raise _UpdateDateFound
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if not self.capturing:
+            text = self.recent + data
+            match = UPDATE_MARKER_RE.search(text)
+            if match is None:
+                self.recent = text[-self.RECENT_CHARS:]
+                return
+            self.capturing = True
+            self.capture_depth = self.block_depth
+            data = text[match.start():]
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size > self.MAX_CAPTURE:
+            raise _UpdateDateFound
+
+def extract_update_date(html: str) -> Optional[str]:
+    """
+    Повертає рядки з датою оновлення або None, якщо в блоці з маркером
+    немає часу з датою (напр. їх підставляє JavaScript).
+    """
+    parser = _UpdateDateParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except _UpdateDateFound:
+        pass
+
+    text = "".join(parser.parts)
+    if not UPDATE_TIME_RE.search(text):
+        return None
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    return "\n".join(lines)
+
+def _fetch_html() -> str:
+    resp = SESSION.get(URL, timeout=15, stream=True)
+    with resp:
+        resp.raise_for_status()
+        body = read_body_limited(resp)
+        content_type = resp.headers.get("Content-Type", "")
+        encoding = resp.encoding if "charset" in content_type.lower() else "utf-8"
+    return body.decode(encoding or "utf-8", errors="replace")
+
 def get_schedule_content() -> Tuple[Optional[str], Optional[str]]:
-    """Повертає дату оновлення."""
+    """
+    Повертає (джерело, дата оновлення).
+    Спочатку пробує звичайний HTTP-запит ("http"); Playwright ("playwright")
+    запускається лише коли дата рендериться на клієнті.
+    """
+    try:
+        update_date = extract_update_date(_fetch_html())
+        if update_date:
+            log_to_buffer(f"✅ Знайдено дату оновлення (HTTP): {update_date}")
+            return "http", update_date
+        log_to_buffer("ℹ️ Дати немає в статичному HTML, запускаю Playwright")
+    except Exception as e:
+        log_to_buffer(f"⚠️ Помилка HTTP при читанні сторінки: {e}, запускаю Playwright")
+
     try:
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
@@ -19,23 +138,14 @@ def get_schedule_content() -> Tuple[Optional[str], Optional[str]]:
             page.goto(URL, wait_until="networkidle", timeout=30000)
             page_content = page.content()
             browser.close()
-            soup = BeautifulSoup(page_content, "html.parser")
-            for br in soup.find_all("br"):
-                br.replace_with("\n")
-            
-            update_date = None
-            
-            for elem in soup.find_all(["div", "span", "p", "h2", "h3", "h4", "h5"]):
-                text = elem.get_text(strip=False)
-                if "Дата" in text and update_date is None:
-                    lines = [line.strip() for line in text.split("\n") if line.strip()]
-                    update_date = "\n".join(lines)
-                    log_to_buffer(f"✅ Знайдено дату оновлення: {update_date}")
-            
-            if not update_date:
+
+            update_date = extract_update_date(page_content)
+            if update_date:
+                log_to_buffer(f"✅ Знайдено дату оновлення (Playwright): {update_date}")
+            else:
                 log_to_buffer("⚠️ Дата оновлення не знайдена")
-            
-            return None, update_date
+
+            return "playwright", update_date
     except Exception as e:
         log_to_buffer(f"❌ Помилка Playwright при читанні тексту: {e}")
         return None, None
@@ -0,0 +1,38 @@
+import os
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def atomic_write_json(data, path: Path) -> None:
+    """Пише JSON у тимчасовий файл поруч і атомарно підміняє ним path."""
+    atomic_write_text(json.dumps(data, ensure_ascii=False, indent=2), path)
+
+
+def atomic_write_text(text: str, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def atomic_copy(src: Path, dst: Path) -> None:
+    """shutil.copy, але читач ніколи не бачить напівзаписаний dst."""
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise